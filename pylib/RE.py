@@ -112,22 +112,26 @@ make your own. It's up to you.
 
 """
 
+from collections import OrderedDict,namedtuple
 from datetime import date # We use day- and month-names of the current locale.
 import re,os
-from re import error,escape,purge,template
+from re import error,escape,template
 from re import I,IGNORECASE,L,LOCALE,M,MULTILINE,S,DOTALL,U,UNICODE,X,VERBOSE,DEBUG
 
 # Public symbols:
 __all__=[
+  "cache_info",
   "compile",
   "error",
   "escape",
   "extend",
   "findall",
+  "finditer",
   "match",
   "purge",
   "read_extensions",
   "search",
+  "set_cache_size",
   "split",
   "sub",
   "subn",
@@ -149,42 +153,105 @@ __all__=[
 # This dictionary holds all extensions, keyed by name.
 _extensions={}
 
-# This RE matches an RE extension, possibly in a larger string.
-_extpat=re.compile(r'(\(\?E:[_A-Za-z][_A-Za-z0-9]*(=[_A-Za-z][_A-Za-z0-9]*)?\))')
+# Every change to _extensions bumps this generation number, so compiled
+# patterns cached under an older generation are never served again.
+_generation=0
+
+# Compiled patterns keyed by (pattern,flags,generation), in least- to
+# most-recently-used order.
+_cache=OrderedDict()
+_cache_max=512
+_cache_stats=dict(hits=0,misses=0,evictions=0)
+
+CacheInfo=namedtuple('CacheInfo','hits misses evictions size maxsize')
+
+# This RE matches an RE extension, possibly in a larger string. Group 1 is
+# the optional label, and group 2 is the name of the extension.
+_extpat=re.compile(r'\(\?E:(?:([_A-Za-z][_A-Za-z0-9]*)=)?([_A-Za-z][_A-Za-z0-9]*)\)')
 
 # This RE matches a line in /etc/RE.rc and ~/.RE.rc.
 _extdef=re.compile(r'^\s*([_A-Za-z][_A-Za-z0-9]*)\s*([=<])(.*)$')
 
 # This RE matches blank lines and comments in /etc/RE.rc and ~/.RE.rc.
 _extcmt=re.compile(r'^\s*(([#;]|//).*)?$')
-                                           
+
+# The extension registry's dependency graph. _deps maps each extension's
+# name to the set of extension names it refers to, and _rdeps maps each name
+# to the set of extensions that refer to it.
+_deps={}
+_rdeps={}
+
+# Fully expanded extension patterns (with no "(?E:...)" references left in
+# them), keyed by name. extend() keeps this up to date.
+_resolved={}
+
+def _resolve(name,chain=()):
+  """Return the fully expanded pattern of the named extension, resolving
+  (and memoizing) any extensions it depends on along the way. The chain
+  argument is the path of extension names that led here, and it's how
+  cycles are detected."""
+
+  try:
+    return _resolved[name]
+  except KeyError:
+    pass
+  if name not in _extensions:
+    raise error('Unregistered RE extension %r'%(name,))
+  if name in chain:
+    raise error('RE extension cycle: %s'%(' -> '.join(chain+(name,)),))
+  chain+=(name,)
+  body=_extpat.sub(lambda m:'(%s)'%(_resolve(m.group(2),chain),),_extensions[name])
+  _resolved[name]=body
+  return body
+
+def _find_cycle(name):
+  """Return a list of extension names describing a dependency cycle
+  through the given name, or None if there is no such cycle."""
+
+  # Iterative DFS over _deps, so very deep registries can't hit Python's
+  # recursion limit.
+  path=[name]
+  todo=[iter(sorted(_deps.get(name,())))]
+  seen=set()
+  while todo:
+    for dep in todo[-1]:
+      if dep==name:
+        return path+[dep]
+      if dep not in seen:
+        seen.add(dep)
+        path.append(dep)
+        todo.append(iter(sorted(_deps.get(dep,()))))
+        break
+    else:
+      todo.pop()
+      path.pop()
+  return None
+
+def _invalidate(name):
+  "Forget the resolved pattern of name and of everything that uses it."
+
+  todo=[name]
+  while todo:
+    n=todo.pop()
+    if _resolved.pop(n,None) is not None or n==name:
+      todo.extend(_rdeps.get(n,()))
+
 def _apply_extensions(pattern,allow_named=True):
   """Return the given pattern with all regexp extension references
-  expanded."""
-
-  outer=True
-  while True:
-    extensions=set([r[0] for r in _extpat.findall(pattern)])
-    if not extensions:
-      break;
-    for ref in extensions:
-      ext=ref[4:-1]
-      #print('D: ext=%r'%(ext,))
-      if not ext:
-        raise error('RE extension name is empty')
-      if '=' in ext:
-        label,ext=ext.split('=')
-      else:
-        label=None
-      #print('D: label=%r, ext=%r'%(label,ext))
-      if ext not in _extensions:
-        raise error('Unregistered RE extension %r'%(ext,))
-      if label and outer and allow_named:
-        pattern=pattern.replace(ref,'(?P<%s>%s)'%(label,_extensions[ext]))
-      else:
-        pattern=pattern.replace(ref,'(%s)'%(_extensions[ext],))
-    outer=False
-  return pattern
+  expanded. This is a single scan of the pattern, since the extensions
+  it refers to have already been resolved."""
+
+  def expand(m):
+    label,name=m.groups()
+    if name in _resolved:
+      body=_resolved[name]
+    else:
+      body=_resolve(name)
+    if label and allow_named:
+      return '(?P<%s>%s)'%(label,body)
+    return '(%s)'%(body,)
+
+  return _extpat.sub(expand,pattern)
 
 def extend(name,pattern,expand=False):
   """Register an extension regexp pattern that can be referenced with
@@ -232,17 +299,63 @@ def extend(name,pattern,expand=False):
 
   If the pattern argument is None, and the value of the name parameter
   is already in the registry, it is de-registered.
+
+  Any change to the registry that would leave an extension referring
+  to itself, directly or through other extensions, raises RE.error and
+  leaves the registry as it was.
   """
 
+  global _generation
+
   if not pattern:
     # Remove name if it's already defined.
     if name in _extensions:
       del _extensions[name]
+      _invalidate(name)
+      _set_deps(name,())
   else:
     # Add this named extension.
     if expand:
       pattern=_apply_extensions(pattern)
+    old_pattern=_extensions.get(name)
+    old_deps=_deps.get(name,())
     _extensions[name]=pattern
+    _set_deps(name,set(m.group(2) for m in _extpat.finditer(pattern)))
+    cycle=_find_cycle(name)
+    if cycle:
+      # Put things back the way they were before complaining.
+      if old_pattern is None:
+        del _extensions[name]
+      else:
+        _extensions[name]=old_pattern
+      _set_deps(name,old_deps)
+      raise error('RE extension cycle: %s'%(' -> '.join(cycle),))
+    _invalidate(name)
+    # Pre-resolve this extension and anything that depends on it. Anything
+    # still referring to an unregistered extension is left for later.
+    todo=[name]
+    seen=set(todo)
+    while todo:
+      n=todo.pop()
+      try:
+        _resolve(n)
+      except error:
+        continue
+      for dep in _rdeps.get(n,()):
+        if dep not in seen:
+          seen.add(dep)
+          todo.append(dep)
+  _generation+=1
+
+def _set_deps(name,deps):
+  "Record the set of extensions the named extension refers to."
+
+  for dep in _deps.pop(name,()):
+    _rdeps[dep].discard(name)
+  if deps:
+    _deps[name]=set(deps)
+    for dep in deps:
+      _rdeps.setdefault(dep,set()).add(name)
 
 def read_extensions(filename='~/.RE.rc'):
   """Read RE extension definitions from the given file. The default
@@ -263,10 +376,70 @@ def read_extensions(filename='~/.RE.rc'):
         name,op,pat=m.groups()
         extend(name,pat,expand=op=='<')
 
+def _compile(pattern,flags=0):
+  """Return the compiled form of the given pattern with any regexp
+  extensions expanded. Results are kept in a bounded LRU cache keyed by
+  (pattern,flags,generation), so repeated calls with the same pattern
+  skip both the expansion and the compilation."""
+
+  if isinstance(pattern,re.Pattern):
+    if flags:
+      raise ValueError('cannot process flags argument with a compiled pattern')
+    return pattern
+  key=(pattern,flags,_generation)
+  try:
+    p=_cache[key]
+  except KeyError:
+    pass
+  else:
+    _cache.move_to_end(key)
+    _cache_stats['hits']+=1
+    return p
+  _cache_stats['misses']+=1
+  p=re.compile(_apply_extensions(pattern),flags)
+  if _cache_max>0:
+    _cache[key]=p
+    while len(_cache)>_cache_max:
+      _cache.popitem(last=False)
+      _cache_stats['evictions']+=1
+  return p
+
+def cache_info():
+  """Return a CacheInfo namedtuple of (hits, misses, evictions, size,
+  maxsize) describing this module's compiled-pattern cache."""
+
+  return CacheInfo(
+    _cache_stats['hits'],
+    _cache_stats['misses'],
+    _cache_stats['evictions'],
+    len(_cache),
+    _cache_max
+  )
+
+def set_cache_size(maxsize):
+  """Set the maximum number of compiled patterns to keep in this
+  module's cache, evicting the least recently used entries as needed.
+  A maxsize of 0 disables caching."""
+
+  global _cache_max
+
+  _cache_max=max(0,int(maxsize))
+  while len(_cache)>_cache_max:
+    _cache.popitem(last=False)
+    _cache_stats['evictions']+=1
+
+def purge():
+  "Clear this module's compiled-pattern cache (and re's too)."
+
+  _cache.clear()
+  for k in _cache_stats:
+    _cache_stats[k]=0
+  re.purge()
+
 def compile(pattern,flags=0):
   "Compile a regular expression pattern, returning a pattern object."
 
-  return re.compile(_apply_extensions(pattern),flags)
+  return _compile(pattern,flags)
 
 def findall(pattern,s,flags=0):
   """Return a list of all non-overlapping matches in the string.
@@ -277,33 +450,33 @@ def findall(pattern,s,flags=0):
 
   Empty matches are included in the result."""
 
-  return re.findall(_apply_extensions(pattern),s,flags)
+  return _compile(pattern,flags).findall(s)
 
 def finditer(pattern,s,flags=0):
   """Return an iterator over all non-overlapping matches in the string.
   For each match, the iterator returns a match object.
 
   Empty matches are included in the result."""
-  
-  return re.finditer(_apply_extensions(pattern),s,flags)
+
+  return _compile(pattern,flags).finditer(s)
 
 def match(pattern,s,flags=0):
   """Try to apply the pattern at the start of the string, returning a
   match object, or None if no match was found."""
 
-  return re.match(_apply_extensions(pattern),s,flags)
+  return _compile(pattern,flags).match(s)
 
 def search(pattern,s,flags=0):
   """Scan through string looking for a match to the pattern, returning a
   match object, or None if no match was found."""
 
-  return re.search(_apply_extensions(pattern),s,flags)
+  return _compile(pattern,flags).search(s)
 
 def split(pattern,s,maxsplit=0,flags=0):
   """Split the source string by the occurrences of the pattern,
   returning a list containing the resulting substrings."""
 
-  return re.split(_apply_extensions(pattern),s,maxsplit,flags)
+  return _compile(pattern,flags).split(s,maxsplit)
 
 def sub(pattern, repl, string, count=0, flags=0):
   """Return the string obtained by replacing the leftmost
@@ -313,7 +486,7 @@ def sub(pattern, repl, string, count=0, flags=0):
   it's passed the match object and must return a replacement string to
   be used."""
 
-  return re.sub(_apply_extensions(pattern),repl,s,count,flags)
+  return _compile(pattern,flags).sub(repl,string,count)
 
 def subn(pattern, repl, string, count=0, flags=0):
   """Return a 2-tuple containing (new_string, number). new_string is the
@@ -324,7 +497,7 @@ def subn(pattern, repl, string, count=0, flags=0):
   processed. If it is a callable, it's passed the match object and must
   return a replacement string to be used."""
 
-  return re.subn(_apply_extensions(pattern),repl,s,count,flags)
+  return _compile(pattern,flags).subn(repl,string,count)
 
  # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -726,6 +899,48 @@ if __name__=='__main__':
     'May'
     >>> search(p,'Dec').groupdict()['month']
     'Dec'
+    >>> # The compiled-pattern cache.
+    >>> purge()
+    >>> p=compile(r'user=(?E:user=id)')
+    >>> compile(r'user=(?E:user=id)') is p
+    True
+    >>> cache_info()[:3]
+    (1, 1, 0)
+    >>> extend('id',r'[a-z]+')
+    >>> compile(r'user=(?E:user=id)').pattern
+    'user=(?P<user>[a-z]+)'
+    >>> extend('id',r'[-_0-9A-Za-z]+')
+    >>> set_cache_size(1)
+    >>> cache_info().evictions
+    1
+    >>> set_cache_size(512)
+    >>> sub(r'(?E:ipv4)','IP','client=123.45.6.78')
+    'client=IP'
+    >>> # Nested extensions are resolved when they're registered.
+    >>> extend('ab',r'a(?E:b)')
+    >>> _apply_extensions(r'(?E:x=ab)')
+    Traceback (most recent call last):
+    ...
+    re.error: Unregistered RE extension 'b'
+    >>> extend('b',r'b(?E:c=id)')
+    >>> _resolved['ab']
+    'a(b([-_0-9A-Za-z]+))'
+    >>> _apply_extensions(r'(?E:x=ab)')
+    '(?P<x>a(b([-_0-9A-Za-z]+)))'
+    >>> # Cycles are reported rather than looping forever.
+    >>> extend('b',r'b(?E:ab)')
+    Traceback (most recent call last):
+    ...
+    re.error: RE extension cycle: b -> ab -> b
+    >>> _extensions['b']
+    'b(?E:c=id)'
+    >>> extend('loop',r'x(?E:loop)')
+    Traceback (most recent call last):
+    ...
+    re.error: RE extension cycle: loop -> loop
+    >>> 'loop' in _extensions
+    False
+    >>> extend('ab',None); extend('b',None)
     """
 
     f,t=testmod(report=False)
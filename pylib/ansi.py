@@ -312,7 +312,7 @@ class Color(object):
     """
 
     if enabled:
-      return str(self)+str(text)+str(norm)
+      return self.__str__()+str(text)+norm.__str__()
     return str(text)
 
   def __repr__(self):
@@ -323,9 +323,18 @@ class Color(object):
       
   def __str__(self):
     """Return the ANSI escape sequence for this object's attribute,
-    foreground, and background"""
+    foreground, and background. The sequence is computed once and then
+    reused until any of those (or the module's current_background or
+    color tables) change."""
 
-    global current_background
+    key=(self.attribute,self.foreground,self.background,current_background,attr,foreground,background)
+    if self.__dict__.get('_key')!=key:
+      self._key=key
+      self._escape=self._build()
+    return self._escape
+
+  def _build(self):
+    "Return a newly built ANSI escape sequence for this Color."
 
     s='\x1b['
     if current_background in background and self.background==current_background:
@@ -345,7 +354,6 @@ class Color(object):
       ])
     s+='m'
     return s
-    #return color(self.attribute,self.foreground,self.background)
 
   def parse(self,spec):
     '''Return the (attr,foreground,background) components from the colorspec.
@@ -525,6 +533,44 @@ class Palette(list):
 
     return self[index%len(self)]
 
+  def render(self,segments):
+    r'''Return a string made from the given (index,text) pairs, with
+    each text colored by this palette's entry at that index (wrapping
+    around as __call__() does). A text whose index is None is left
+    uncolored. Adjacent texts of the same color share a single escape
+    sequence, and everything is joined only once, so this is an
+    inexpensive way to color a whole line of output.
+
+    >>> pal=Palette('red on black,green')
+    >>> pal.render([(0,'a'),(0,'b'),(None,' '),(1,'c'),(3,'d')])
+    '\x1b[31mab\x1b[0m \x1b[32mcd\x1b[0m'
+    >>> pal.render([(1,'x'),(0,'y')])
+    '\x1b[32mx\x1b[0m\x1b[31my\x1b[0m'
+    >>> pal.render([])
+    ''
+    >>> Palette('red,green,red').render([(0,'a'),(2,'b'),(1,'c')])
+    '\x1b[31mab\x1b[0m\x1b[32mc\x1b[0m'
+    '''
+
+    if not enabled:
+      return ''.join([text for i,text in segments])
+    off=norm.__str__()
+    n=len(self)
+    parts=[]
+    current=None # The escape sequence now in effect, if any.
+    for i,text in segments:
+      esc=None if i is None else self[i%n].__str__()
+      if esc!=current:
+        if current is not None:
+          parts.append(off)
+        if esc is not None:
+          parts.append(esc)
+        current=esc
+      parts.append(text)
+    if current is not None:
+      parts.append(off)
+    return ''.join(parts)
+
 norm=Color('normal',None,None) #'\033['+attr['normal']+'m'
 
 def flatten_list(l,result=None):
@@ -106,7 +106,8 @@ A DebugChannel instance can also be used as a function decorator:
     example2("Second test",2)
 
 This causes entry into and exit from the decorated function to be
-announced in the given DeviceChannel's output. If you put that into a
+announced in the given DeviceChannel's output. (If "@dc" is too clever
+for your taste, "@dc.decorate" does exactly the same thing.) If you put that into a
 file named foo.py and then run "python3 -m foo", you'll get this:
 
     DC: __main__: Calling example2('First test',3) ...
@@ -129,6 +130,15 @@ file named foo.py and then run "python3 -m foo", you'll get this:
     DC: example2:   Function example1 returns None after 0.000023 seconds.
     DC: __main__: Function example2 returns None after 4.019719 seconds.
 
+A disabled DebugChannel returns from dc(...) immediately, but Python
+still has to build whatever message you pass it. If that's expensive,
+pass a function (usually a lambda) or a format template and its
+arguments instead, and that work is only done when the channel is
+enabled:
+
+    dc(lambda: f"state={expensive_summary(state)}")
+    dc("i={} j={}",i,j)
+
 That's a very general start. See DebugChannel's docs for more.
 """
 
@@ -139,7 +149,7 @@ __all__=[
 ]
 __version__='0.1.0'
 
-import inspect,os,sys,traceback
+import atexit,functools,linecache,os,string,sys,traceback,types
 # Because I need "time" to be a local variable in DebugChannel.write() ...
 from time import gmtime,localtime,strftime,time as get_time
 
@@ -160,6 +170,22 @@ def line_iter(s):
       j+=1
     i=j
 
+# Message values of these types are called (with no arguments) to get the
+# actual message, but only if the DebugChannel is enabled.
+_lazy_types=(types.FunctionType,types.MethodType,functools.partial)
+
+def _called_as_decorator(frame):
+  """Return True if the code in the given frame looks like it's
+  applying a decorator, i.e. the line it's executing (or the line just
+  before that) starts with "@"."""
+
+  filename=frame.f_code.co_filename
+  lineno=frame.f_lineno
+  for n in (lineno-1,lineno):
+    if linecache.getline(filename,n).lstrip().startswith('@'):
+      return True
+  return False
+
 class DebugChannel(object):
   """Objects of this class are really useful for debugging, and this is
   even more powerful when combined with loggy.LogStream to write all
@@ -215,7 +241,9 @@ class DebugChannel(object):
       date_fmt='%Y-%m-%d',
       time_fmt='%H:%M:%S',
       time_tupler=localtime,
-      callback=None
+      callback=None,
+      buffer_size=0,
+      flush_interval=1.0
     ):
     """Initialize the stream and on/off state of this new DebugChannel
     object. The "enabled" state defaults to False, and the stream
@@ -237,11 +265,18 @@ class DebugChannel(object):
                    localtime.
       callback     A function accepting keyword arguments and returning
                    True if the current message is to be output. The
-                   keyword arguments are all the local variables of
-                   DebugChannel.write(). Of particular interest might be
-                   "stack" and all the variables available for
-                   formatting: label, basename, pid, function, line,
-                   indent, and message.
+                   keyword arguments are "frame" (the caller's stack
+                   frame) and all the variables available for
+                   formatting: date, time, label, pid, pathname,
+                   basename, function, line, code, indent, and message.
+      buffer_size  If 0 (the default), our stream is flushed after each
+                   message. Otherwise, output is collected until at
+                   least this many characters are waiting, or until
+                   flush_interval seconds have passed since the last
+                   flush, or until the program exits. Then it's written
+                   and flushed. See flush().
+      flush_interval  The longest time (in seconds) buffered output is
+                   held before being written. See buffer_size.
 
     """
 
@@ -250,7 +285,7 @@ class DebugChannel(object):
     self.stream=stream
     self.enabled=enabled
     self.pid=os.getpid()
-    self.fmt=fmt
+    self.setFormat(fmt)
     self.indlev=0
     self.label=label
     self.indstr=indent_with
@@ -261,9 +296,18 @@ class DebugChannel(object):
     self.time_fmt=time_fmt
     self.time_tupler=time_tupler
     self.callback=callback
+    self.buffer_size=buffer_size
+    self.flush_interval=flush_interval
+    self._buf=[] # Output waiting to be written in buffered mode.
+    self._buflen=0
+    self._flushed=get_time()
+    if buffer_size:
+      atexit.register(self.flush)
+    # Map code objects to (pathname,basename,function,ignored) tuples.
+    self._code_info={}
     # Do not report functions in this debug module.
     self.ignore={}
-    self.ignoreModule(os.path.normpath(inspect.stack()[0].filename))
+    self.ignoreModule(os.path.normpath(sys._getframe().f_code.co_filename))
 
   def __bool__(self):
     """Return the Enabled state of this DebugChannel object. It is
@@ -305,9 +349,11 @@ class DebugChannel(object):
     if name in sys.modules:
       m=str(sys.modules[name])
       name=m[m.find(" from '")+7:m.rfind(".py")+3]
+    name=os.path.normpath(name)
     if name not in self.ignore:
       self.ignore[name]=set([])
     self.ignore[name].update(args)
+    self._code_info.clear()
 
   def setDateFormat(self,fmt):
     """Use the formatting rules of strftime() to format the "date"
@@ -356,9 +402,16 @@ class DebugChannel(object):
     DebugChannel object is configured to write to a LogStream object
     that writes to syslog or something similar, you might want to remove
     the {date} and {time} (and maybe {label}) fields from the default
-    format string to avoid logging these values redundantly."""
+    format string to avoid logging these values redundantly.
+
+    The format string is parsed here, once, so that write() only
+    computes the fields it actually uses."""
 
     self.fmt=fmt
+    self._fields=set()
+    for literal,field,spec,conv in string.Formatter().parse(fmt):
+      if field:
+        self._fields.add(field.split('.')[0].split('[')[0])
 
   def indent(self,indent=1):
     """Increase this object's current indenture by this value (which
@@ -389,54 +442,114 @@ class DebugChannel(object):
     """Just a wrapper for the write() method. The message in the arg
     argument can be a single- line string, multi-line string, list,
     tuple, or dict. See write() for details.
+
+    If any further arguments are given, arg is a format template, and
+    the message is arg.format(*args,**kwargs). If arg is a function (or
+    a lambda), the message is whatever it returns. Either way, this
+    work is done only if this DebugChannel is enabled.
+
+    If this DebugChannel is disabled and arg isn't callable, this
+    method returns immediately, doing nothing at all.
+
+    If this method is called as a function decorator (e.g. "@dc"),
+    it returns decorate(arg).
     """
 
-    lines=inspect.stack(context=2)[1].code_context
-    if lines and any(l.lstrip().startswith('@') for l in lines):
-      # We're being called as a decorator.
-      def f(*args,**kwargs):
-        # Record how this function is being called.
-        sig=','.join([repr(a) for a in args]+[f"{k}={v!r}" for k,v in kwargs.items()])
-        self.write(f"{arg.__name__}({sig}) ...").indent()
-        t0=get_time()
-        # Call the function we're wrapping
-        ret=arg(*args,**kwargs)
-        # Record this function's return.
-        t1=get_time()
-        sig='...' if sig else ''
-        dt=t1-t0
-        d,dt=divmod(dt,86400) # Days
-        if d:
-          d=f"{int(d)}d"
-        else:
-          d=''
-        h,dt=divmod(dt,3600) # Hours
-        if h:
-          h=f"{int(h)}h"
-        else:
-          h='0h' if d else ''
-        m,dt=divmod(dt,60) # Minutes
-        if m:
-          m=f"{int(m)}m"
-        else:
-          m='0m' if h else ''
-        if m: # Seconds
-          s=f"{int(dt)}s"
-        else:
-          if dt>=1: # Fractional seconds
-            s=f"{dt:0.3f}"
-            s=s[:4].rstrip('0')+'s'
-          elif dt>=0.001: # Milliseconds
-            s=f"{int(dt*1000)}ms"
-          else: # Microseconds
-            s=f"{int(dt*1e6)}µs"
-        self.undent().write(f"{arg.__name__}({sig}) returns {ret!r} after {d}{h}{m}{s}.")
-        return ret
-      return f
+    if not self.enabled and not callable(arg):
+      return self
+    # Lambdas can't be decorated, so don't bother looking for a decorator.
+    if callable(arg) and getattr(arg,'__name__',None)!='<lambda>':
+      if _called_as_decorator(sys._getframe(1)):
+        return self.decorate(arg)
+    if not self.enabled:
+      return self
 
     # We were called as a regulear method.
+    if args or kwargs:
+      arg=arg.format(*args,**kwargs)
     return self.write(arg)
 
+  def decorate(self,func):
+    """Return a wrapper around the given function that announces each
+    call to it and each return from it in this DebugChannel's output,
+    along with how long the call took. Whether this DebugChannel is
+    enabled is checked when the wrapped function is called, and if it's
+    disabled, the wrapper just calls the function."""
+
+    @functools.wraps(func)
+    def f(*args,**kwargs):
+      if not self.enabled:
+        return func(*args,**kwargs)
+      # Record how this function is being called.
+      sig=','.join([repr(a) for a in args]+[f"{k}={v!r}" for k,v in kwargs.items()])
+      self.write(f"{func.__name__}({sig}) ...").indent()
+      t0=get_time()
+      # Call the function we're wrapping
+      ret=func(*args,**kwargs)
+      # Record this function's return.
+      t1=get_time()
+      sig='...' if sig else ''
+      dt=t1-t0
+      d,dt=divmod(dt,86400) # Days
+      if d:
+        d=f"{int(d)}d"
+      else:
+        d=''
+      h,dt=divmod(dt,3600) # Hours
+      if h:
+        h=f"{int(h)}h"
+      else:
+        h='0h' if d else ''
+      m,dt=divmod(dt,60) # Minutes
+      if m:
+        m=f"{int(m)}m"
+      else:
+        m='0m' if h else ''
+      if m: # Seconds
+        s=f"{int(dt)}s"
+      else:
+        if dt>=1: # Fractional seconds
+          s=f"{dt:0.3f}"
+          s=s[:4].rstrip('0')+'s'
+        elif dt>=0.001: # Milliseconds
+          s=f"{int(dt*1000)}ms"
+        else: # Microseconds
+          s=f"{int(dt*1e6)}µs"
+      self.undent().write(f"{func.__name__}({sig}) returns {ret!r} after {d}{h}{m}{s}.")
+      return ret
+    return f
+
+  def flush(self):
+    """Write any buffered output to our stream, and flush the stream.
+    Return this DebugChannel object."""
+
+    if getattr(self.stream,'closed',False):
+      # Nowhere left to write (e.g. at exit, after the caller closed it).
+      self._buf.clear()
+      self._buflen=0
+      return self
+    if self._buf:
+      self.stream.write(''.join(self._buf))
+      self._buf.clear()
+      self._buflen=0
+    self._flushed=get_time()
+    self.stream.flush()
+    return self
+
+  def _codeInfo(self,code):
+    """Return a (pathname,basename,function,ignored) tuple for the given
+    code object, where ignored is True if ignoreModule() says frames
+    running this code aren't to be reported."""
+
+    pathname=os.path.normpath(code.co_filename)
+    function=code.co_name
+    ignored=pathname in self.ignore and (
+      not self.ignore[pathname] or function in self.ignore[pathname]
+    )
+    if function=='<module>':
+      function='__main__'
+    return (pathname,os.path.basename(pathname),function,ignored)
+
   def writeTraceback(self,exc):
     """Write the given exception with traceback information to our
     output stream."""
@@ -475,86 +588,93 @@ class DebugChannel(object):
     
         key: value
         
-    to its own log line. The keys are sorted in ascending order."""
+    to its own log line. The keys are sorted in ascending order.
+
+    If message is a function (e.g. a lambda), it's called with no
+    arguments, and its return value is used as described above."""
 
     if self.enabled:
+      if isinstance(message,_lazy_types):
+        message=message()
+      fields=self._fields
+      callback=self.callback
+      now=get_time()
+      v={}
+
       # Update our formatted date and time if necessary.
-      t=int(get_time()) # Let's truncate at whole seconds.
-      if self._t!=t:
-        t=self.time_tupler(t)
-        self._t=t
-        self.date=strftime(self.date_fmt,t)
-        self.time=strftime(self.time_fmt,t)
-      # Set local variables for date and time so they're available for output.
-      date=self.date
-      time=self.time
-      # Find the first non-ignored stack frame whence we were called.
-      pathname,basename,line=None,None,None
-      for i,frame in enumerate(inspect.stack()):
-# This is for debugging debug.py. It turns out Python 3.6 has a bug in
-# inspect.stack() that can return outrageous values for frame.index.
-# (So I'm asking for only one line of context, and I've stopped using the
-# frame's untrustworthy index value.)
-#       print(f"""{i}:
-#   frame:        {frame.frame!r}
-#   filename:     {frame.filename!r}
-#   lineno:       {frame.lineno!r}
-#   function:     {frame.function!r}
-#   code_context: {frame.code_context!r}
-#   index:        {frame.index!r}""")
-        p=os.path.normpath(frame.filename)
-        if p not in self.ignore:
+      if callback or 'date' in fields or 'time' in fields:
+        t=int(now) # Let's truncate at whole seconds.
+        if self._t!=t:
+          self._t=t
+          t=self.time_tupler(t)
+          self.date=strftime(self.date_fmt,t)
+          self.time=strftime(self.time_fmt,t)
+        v['date']=self.date
+        v['time']=self.time
+
+      # Find the first non-ignored stack frame whence we were called. What
+      # we need to know about each code object is cached, so this is just
+      # a dictionary lookup or two per frame.
+      code_info=self._code_info
+      frame=f=sys._getframe(1)
+      while f:
+        info=code_info.get(f.f_code)
+        if info is None:
+          info=code_info[f.f_code]=self._codeInfo(f.f_code)
+        frame=f
+        if not info[3]:
           break
-          if frame.function not in self.ignore[p]:
-            break
-      # Set some local variables so they'll be available to our callback
-      # function and for formatting.
-      pid=self.pid
-      pathname=os.path.normpath(frame.filename)
-      basename=os.path.basename(pathname)
-      line=frame.lineno
-      function=frame.function
-      if str(function)=='<module>':
-        function='__main__'
-      code=frame.code_context
-      if code:
-        code=code[0].rstrip()
-      else:
-        code=None
-      indent=self.indstr*self.indlev
-      label=self.label
+        f=f.f_back
+      v['pathname'],v['basename'],v['function']=info[:3]
+      v['line']=frame.f_lineno
+      if callback or 'code' in fields:
+        v['code']=linecache.getline(frame.f_code.co_filename,frame.f_lineno).rstrip() or None
+      v['pid']=self.pid
+      v['indent']=self.indstr*self.indlev
+      v['label']=self.label
 
       # If our caller provided a callback function, call that now.
-      if self.callback:
-        if not self.callback(**locals()):
+      if callback:
+        if not callback(frame=frame,message=message,**v):
           return self # Return without writing any output.
 
-      # Format our message and write it to the debug stream.
+      # Format our message and write it to (or buffer it for) our stream.
+      fmt=self.fmt
+      out=[]
       if isinstance(message,(list,tuple)):
         if isinstance(message,tuple):
           left,right='()'
         else:
           left,right='[]'
-        messages=message
-        message=left;self.stream.write(self.fmt.format(**locals()))
-        for message in messages:
-          message=self.indstr+message
-          self.stream.write(self.fmt.format(**locals()))
-        message=right;self.stream.write(self.fmt.format(**locals()))
+        v['message']=left;out.append(fmt.format_map(v))
+        for m in message:
+          v['message']=self.indstr+m
+          out.append(fmt.format_map(v))
+        v['message']=right;out.append(fmt.format_map(v))
       elif isinstance(message,dict):
         messages=dict(message)
-        message='{';self.stream.write(self.fmt.format(**locals()))
+        v['message']='{';out.append(fmt.format_map(v))
         for k in messages.keys():
-          message=f"{self.indstr}{k}: {messages[k]}"
-          self.stream.write(self.fmt.format(**locals()))
-        message='}';self.stream.write(self.fmt.format(**locals()))
+          v['message']=f"{self.indstr}{k}: {messages[k]}"
+          out.append(fmt.format_map(v))
+        v['message']='}';out.append(fmt.format_map(v))
       elif isinstance(message,str) and os.linesep in message:
-        messages=message
-        for message in line_iter(messages):
-          self.stream.write(self.fmt.format(**locals()))
+        for m in line_iter(message):
+          v['message']=m
+          out.append(fmt.format_map(v))
+      else:
+        v['message']=message
+        out.append(fmt.format_map(v))
+      out=''.join(out)
+
+      if self.buffer_size:
+        self._buf.append(out)
+        self._buflen+=len(out)
+        if self._buflen>=self.buffer_size or now-self._flushed>=self.flush_interval:
+          self.flush()
       else:
-        self.stream.write(self.fmt.format(**locals()))
-      self.stream.flush()
+        self.stream.write(out)
+        self.stream.flush()
 
     # Let the caller call other methods by using our return value.
     return self
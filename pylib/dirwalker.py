@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import os
+from handy import DirScanner
 
  # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -27,35 +28,64 @@ class DirWalkerBase(object):
     if self.__class__.__name__=='DirWalkerBase':
       raise NotImplementedError('%s is an abstract base class and must not be instantiated directly.'%(self.__class__.__name__,))
 
-  def walk(self,root,follow_links=True):
+  def walk(self,root,follow_links=True,workers=0):
     """Start walking the subdirectory tree at root, safely following
     symlinks if follow_links is True (the default). For each path
-    visited, call the visit method with the name of the path and a list
-    of directory entries. The visit method may modify the list of
-    directory entries to cull them, but it must do so "in place"."""
+    visited, call the visit method with the name of the path and a
+    list of directory entries (in alphabetical order). The visit method
+    may modify the list of directory entries to cull them, but it must
+    do so "in place".
+
+    If workers is greater than 0, that many threads list directories
+    ahead of the traversal (see handy.DirScanner), but visit() is still
+    called in the same order, and always from this thread. Either way,
+    the time taken to list each directory is recorded in this object's
+    stats attribute (a handy.ScanStats object)."""
 
     self.root=root
     self.been_here=set([])
     self.follow_links=follow_links
-    self._walk(self.root)
+    with DirScanner(workers) as scanner:
+      self.stats=scanner.stats
+      self._walk(scanner,self.root)
 
-  def _walk(self,path):
+  def _walk(self,scanner,root):
     "For internal use only. Keep your mitts off this one."
 
-    # Protection for infinite symlink loops.
-    p=os.path.realpath(path)
-    if p in self.been_here:
-      return
-    self.been_here.add(p)
-
-    # Process this directory.
-    flist=os.listdir(path)
-    self.visit(path,flist)
-    for fn in flist:
-      p=os.path.join(path,fn)
-      if os.path.isdir(p):
-        if self.follow_links or not os.path.islink(p):
-          self._walk(p)
+    # This stack holds (path,stat) tuples. The stat value is None for the
+    # root, and it's the (cached) os.stat() result for everything else.
+    stack=[(root,None)]
+    while stack:
+      path,st=stack.pop()
+
+      # Protection for infinite symlink loops.
+      if st is None:
+        st=os.stat(path)
+      key=(st.st_dev,st.st_ino)
+      if key in self.been_here:
+        scanner.discard(path)
+        continue
+      self.been_here.add(key)
+
+      # Process this directory.
+      scanner.prefetch(p for p,s in reversed(stack))
+      entries={e.name:e for e in scanner.scan(path)}
+      flist=sorted(entries)
+      self.visit(path,flist)
+      subdirs=[]
+      for fn in flist:
+        e=entries.get(fn)
+        try:
+          if e is None or not e.is_dir():
+            continue
+          if self.follow_links or not e.is_symlink():
+            subdirs.append((e.path,e.stat()))
+        except OSError:
+          pass
+      # Push these in reverse so they're processed in order, and get the
+      # next few directories we'll need started in the background.
+      stack.extend(reversed(subdirs))
+      scanner.prefetch(p for p,s in reversed(stack))
 
   def visit(self,path,files):
     raise NotImplementedError('%s.visit() may not be called directly. Implement this method in a subclass.'%(self.__class__.__name__,))
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+"""
+This module answers "is DST in effect?" questions about the local time
+zone (as the time module sees it) without asking the C library every
+time. Asking time.localtime() once per timestamp is fine for one
+timestamp, but it dominates the run time of anything that converts
+millions of them.
+
+A DstTable finds the moments DST begins and ends in each year the first
+time that year is asked about, and remembers them. After that, each
+question is answered by a bisect over those moments.
+
+    from dsttable import DstTable
+    dst=DstTable()
+    dst.is_dst(1700000000)                # Same as time.localtime(1700000000).tm_isdst==1
+    dst.is_dst_wall(2023,7,4,12,0,0)      # Same as time.localtime(time.mktime(
+                                          #   (2023,7,4,12,0,0,0,0,-1))).tm_isdst==1
+
+Wall-clock times that fall in a DST gap or overlap (e.g. 02:30 on the
+morning clocks spring forward) are still handed to mktime(), so that
+its answer for those times is preserved exactly.
+
+Code that just wants the local time zone's answers can share this
+module's local_dst instance rather than building its own table:
+
+    from dsttable import local_dst
+    local_dst.is_dst(1700000000)
+
+If the process's time zone changes (e.g. by setting TZ and calling
+time.tzset()), create a new DstTable.
+"""
+
+__all__=[
+  'DstTable',
+  'local_dst',
+]
+
+import bisect,calendar,time
+
+class DstTable(object):
+  """A DstTable knows when DST begins and ends in the local time zone
+  for the years it's been asked about."""
+
+  # How far apart our samples of each year are when looking for
+  # transitions. (Transitions closer together than this could be missed,
+  # but no time zone has ever needed that.)
+  step=6*3600
+
+  def __init__(self):
+    self.first=self.last=None # The range of years we've loaded.
+    self.years={}   # key=year, value=list of (epoch,before,after) tuples
+    self.start=None # The epoch where our table starts.
+    self.end=None   # The epoch where our table ends.
+    self.initial=False # Whether DST is in effect at self.start.
+    self.times=[]   # Epochs where tm_isdst changes.
+    self.states=[]  # Whether DST is in effect from each of those times on.
+    self.wall_start=[] # The wall-clock window around each transition in
+    self.wall_end=[]   # which a local time is either missing or repeated.
+    self.months={}  # key=(year,month), value=epoch of that month's start
+
+  @staticmethod
+  def _local(t):
+    "Return (is_dst,utc_offset) for epoch t."
+
+    lt=time.localtime(t)
+    return lt.tm_isdst==1,lt.tm_gmtoff
+
+  def _load_year(self,year):
+    """Return a list of (epoch,(dst,offset) before,(dst,offset) after)
+    tuples for each DST transition in the given (UTC) year."""
+
+    transitions=[]
+    t=calendar.timegm((year,1,1,0,0,0,0,0,0))
+    end=calendar.timegm((year+1,1,1,0,0,0,0,0,0))
+    prev=self._local(t)
+    while t<end:
+      u=min(t+self.step,end)
+      cur=self._local(u)
+      if cur[0]!=prev[0]:
+        # Bisect for the first second of the new state.
+        lo,hi=t,u
+        while hi-lo>1:
+          mid=(lo+hi)//2
+          if self._local(mid)[0]==prev[0]:
+            lo=mid
+          else:
+            hi=mid
+        transitions.append((hi,self._local(lo),self._local(hi)))
+      t,prev=u,cur
+    return transitions
+
+  def _cover(self,year):
+    "Make sure our table covers the given year and the years next to it."
+
+    if self.first is None:
+      first,last=year-1,year+1
+    else:
+      first,last=min(self.first,year-1),max(self.last,year+1)
+    for y in range(first,last+1):
+      if y not in self.years:
+        self.years[y]=self._load_year(y)
+    self.first,self.last=first,last
+    self.start=calendar.timegm((first,1,1,0,0,0,0,0,0))
+    self.end=calendar.timegm((last+1,1,1,0,0,0,0,0,0))
+    self.initial=self._local(self.start)[0]
+    transitions=[tr for y in range(first,last+1) for tr in self.years[y]]
+    self.times=[t for t,before,after in transitions]
+    self.states=[after[0] for t,before,after in transitions]
+    self.wall_start=[t+min(before[1],after[1]) for t,before,after in transitions]
+    self.wall_end=[t+max(before[1],after[1]) for t,before,after in transitions]
+
+  def is_dst(self,t):
+    """Return True iff DST is in effect in the local time zone at epoch
+    t. This is always the same as time.localtime(t).tm_isdst==1."""
+
+    if self.start is None or not self.start<=t<self.end:
+      try:
+        self._cover(time.gmtime(t).tm_year)
+      except (OverflowError,ValueError,OSError):
+        return time.localtime(t).tm_isdst==1
+    i=bisect.bisect_right(self.times,t)
+    return self.states[i-1] if i else self.initial
+
+  def is_dst_wall(self,year,month,day,hour=0,minute=0,second=0):
+    """Return True iff DST is in effect at the given local wall-clock
+    time. This is always the same as
+
+        time.localtime(time.mktime(
+          (year,month,day,hour,minute,second,0,0,-1)
+        )).tm_isdst==1
+    """
+
+    # Treat the wall-clock time as if it were UTC.
+    m=self.months.get((year,month))
+    if m is None:
+      m=self.months[year,month]=calendar.timegm((year,month,1,0,0,0,0,0,0))
+    w=m+(day-1)*86400+hour*3600+minute*60+second
+    # Our table's margins are at least a year wide, so a wall-clock time
+    # is safely inside it whenever the same number as an epoch is.
+    if self.start is None or not self.start<=w<self.end:
+      try:
+        self._cover(year)
+      except (OverflowError,ValueError,OSError):
+        w=None
+    if w is not None:
+      i=bisect.bisect_right(self.wall_start,w)
+      if not i or w>=self.wall_end[i-1]:
+        return self.states[i-1] if i else self.initial
+    # This local time is missing or repeated, so mktime() decides.
+    t=time.mktime((year,month,day,hour,minute,second,0,0,-1))
+    return time.localtime(t).tm_isdst==1
+
+# The local time zone's DstTable, for any code that would rather share one.
+local_dst=DstTable()
@@ -30,9 +30,22 @@ you can write
 
 instead. Isn't that nicer!
 
+Starting exiftool (a Perl program) takes far longer than having it read
+a file's metadata, so if you have many files to read, use an
+ExifToolSession. It keeps one exiftool process running (using exiftool's
+-stay_open option) and reads files in batches.
+
+    with ExifToolSession() as et:
+      for filename,exif in zip(filenames,et.readfiles(filenames,batch=100)):
+        if exif:
+          print(filename,exif.EXIF.DateTimeOriginal)
+
+readfile() uses a session of its own, which is started on the first call
+and stays open until the program ends.
+
 '''
 
-import datetime,json,os,re,subprocess,sys
+import atexit,datetime,json,os,re,subprocess,sys,threading
 from types import SimpleNamespace
 
 class ComplexNamespace(SimpleNamespace):
@@ -80,7 +93,7 @@ class ComplexNamespace(SimpleNamespace):
 
 
 # Use this RE to parse date and time from EXIF data.
-re_exif_time=re.compile('(?P<year>\d\d\d\d):(?P<mon>\d\d):(?P<day>\d\d) (?P<hour>\d\d):(?P<min>\d\d):(?P<sec>\d\d)(\.(?P<cs>\d\d))?')
+re_exif_time=re.compile(r'(?P<year>\d\d\d\d):(?P<mon>\d\d):(?P<day>\d\d) (?P<hour>\d\d):(?P<min>\d\d):(?P<sec>\d\d)(\.(?P<frac>\d+))?')
 
 def exiftool(*args):
   'Run exiftool with the given arguments and return [stdout,stderr].'
@@ -89,35 +102,173 @@ def exiftool(*args):
   try:
     rc=subprocess.Popen(clist,bufsize=16384,stdout=subprocess.PIPE,stderr=subprocess.PIPE).communicate()
   except OSError as e:
-    errno,strerr=e
-    print('%s: %s: exiftool %s'%(os.path.basename(sys.argv[0]),strerr,clist),file=sys.stderr)
+    print('%s: %s: exiftool %s'%(os.path.basename(sys.argv[0]),e.strerror,clist),file=sys.stderr)
     sys.exit(1)
   return rc
 
+def convert_times(d):
+  """Convert any EXIF-formatted timestamp strings in the groups of the
+  given dictionary (as exiftool -g -json writes them) to datetime values,
+  in place, and return d. Any time zone that follows the time is
+  ignored.
+
+  >>> convert_times({'EXIF':{'DateTimeOriginal':'2021:07:04 12:34:56','Make':'Canon'},'Composite':{'SubSecDateTimeOriginal':'2021:07:04 12:34:56.25-04:00'}})
+  {'EXIF': {'DateTimeOriginal': datetime.datetime(2021, 7, 4, 12, 34, 56), 'Make': 'Canon'}, 'Composite': {'SubSecDateTimeOriginal': datetime.datetime(2021, 7, 4, 12, 34, 56, 250000)}}
+  """
+
+  match=re_exif_time.match
+  for dd in d.values():
+    if isinstance(dd,dict):
+      for key,val in dd.items():
+        # Only strings that look like "YYYY:MM:DD HH..." are worth a regex.
+        if isinstance(val,str) and len(val)>=19 and val[4]==':' and val[10]==' ':
+          m=match(val)
+          if m:
+            frac=m.group('frac') or '0'
+            try:
+              dd[key]=datetime.datetime(
+                int(m.group('year')),int(m.group('mon')),int(m.group('day')),
+                int(m.group('hour')),int(m.group('min')),int(m.group('sec')),
+                int(frac[:6].ljust(6,'0'))
+              )
+            except ValueError:
+              pass # E.g. "0000:00:00 00:00:00" from a camera that wasn't set.
+  return d
+
+class ExifToolError(Exception):
+  pass
+
+class ExifToolSession(object):
+  """An ExifToolSession keeps a single exiftool process running (using
+  exiftool's "-stay_open True -@ -" mode), and sends it batches of files
+  to read. This saves starting a new Perl interpreter for every file.
+
+  Use it as a context manager, or call close() when you're done with it.
+
+  executable - The exiftool command to run. (default: "exiftool")
+  args       - Arguments given for every batch of files. (default:
+               ("-g","-json"), which readfiles() depends on.)
+  """
+
+  def __init__(self,executable='exiftool',args=('-g','-json')):
+    self.args=list(args)
+    self.errors=[]
+    self._count=0
+    try:
+      self.proc=subprocess.Popen(
+        [executable,'-stay_open','True','-@','-'],
+        stdin=subprocess.PIPE,stdout=subprocess.PIPE,stderr=subprocess.PIPE,
+        encoding='utf-8',errors='surrogateescape'
+      )
+    except OSError as e:
+      raise ExifToolError(f"{e.strerror}: {executable}")
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self,*exc):
+    self.close()
+
+  def close(self):
+    "Tell exiftool to exit, and wait for it to do so."
+
+    if self.proc and self.proc.poll() is None:
+      try:
+        self.proc.stdin.write('-stay_open\nFalse\n')
+        self.proc.stdin.flush()
+        self.proc.stdin.close()
+        self.proc.wait(timeout=10)
+      except (OSError,subprocess.TimeoutExpired):
+        self.proc.kill()
+        self.proc.wait()
+    if self.proc:
+      self.proc.stdout.close()
+      self.proc.stderr.close()
+    self.proc=None
+
+  def execute(self,*args):
+    """Have our exiftool process run with the given arguments, and return
+    an (stdout,stderr) tuple of strings."""
+
+    if self.proc is None:
+      raise ExifToolError('This ExifToolSession is closed.')
+    self._count+=1
+    ready='{ready%d}'%self._count
+    self.proc.stdin.write(''.join([
+      a+'\n' for a in ['-echo4',ready]+list(args)+['-execute%d'%self._count]
+    ]))
+    self.proc.stdin.flush()
+    # Read stderr alongside stdout. Otherwise, enough warnings would fill
+    # its pipe, and exiftool would wait on us while we wait on it.
+    err=[]
+    def read_stderr():
+      try:
+        err.append(self._read_until(self.proc.stderr,ready))
+      except ExifToolError as e:
+        err.append(e)
+    t=threading.Thread(target=read_stderr,daemon=True)
+    t.start()
+    try:
+      out=self._read_until(self.proc.stdout,ready)
+    finally:
+      t.join()
+    if isinstance(err[0],ExifToolError):
+      raise err[0]
+    return out,err[0]
+
+  def _read_until(self,f,ready):
+    "Return what's read from f up to the given {ready} line."
+
+    lines=[]
+    for line in f:
+      if line.rstrip('\r\n')==ready:
+        return ''.join(lines)
+      lines.append(line)
+    raise ExifToolError(f"exiftool exited unexpectedly: {''.join(lines)}")
+
+  def readfiles(self,paths,batch=100):
+    """Return a list of ComplexNamespace objects (see readfile()), one for
+    each of the given paths, in the same order, reading batch files per
+    round trip to exiftool. An element is None if exiftool couldn't read
+    that file, and exiftool's complaints are in this object's errors
+    attribute (a list of strings)."""
+
+    paths=list(paths)
+    results=[]
+    self.errors=[]
+    for i in range(0,len(paths),max(1,batch)):
+      chunk=paths[i:i+max(1,batch)]
+      out,err=self.execute(*self.args+['-charset','filename=utf8','--']+chunk)
+      if err:
+        self.errors.extend(err.splitlines())
+      found={}
+      for d in (json.loads(out) if out.strip() else []):
+        found[d.get('SourceFile')]=d
+      for path in chunk:
+        d=found.get(path)
+        results.append(None if d is None else ComplexNamespace(**convert_times(d)))
+    return results
+
+_session=None
+
 def readfile(filename):
   '''Return a python object (an instance of class ComplexNamespace)
   whose attributes contain the grouped EXIF tags of the given file.'''
 
-  out,err=exiftool('-g','-json',filename)
-  if err:
-    print('exiftool error:\n'+err, file=sys.stderr)
+  global _session
+
+  if _session is None:
+    try:
+      _session=ExifToolSession()
+    except ExifToolError as e:
+      print('%s: %s'%(os.path.basename(sys.argv[0]),e),file=sys.stderr)
+      sys.exit(1)
+    atexit.register(_session.close)
+  exif,=_session.readfiles([filename])
+  if _session.errors:
+    print('exiftool error:\n'+'\n'.join(_session.errors), file=sys.stderr)
     sys.exit(1)
-  d=json.loads(out)[0]                # Read exiftool's JSON output, and
-  d=eval(re.sub(r"\bu'","'",repr(d))) # convert unicode to regular strings.
-  for g in d: # Iterate through each group of metadata that exiftool found.
-    dd=d[g]
-    if isinstance(dd,dict):
-      for key,val in dd.items():
-        # Convert any string timestamps to Python datetime values.
-        #print 'key=%r val=%r'%(key,val)
-        if isinstance(val,str):
-          m=re_exif_time.match(val)
-          if m:
-            t=m.groupdict('0')
-            for x in t:
-              t[x]=int(t[x])
-            dd[key]=datetime.datetime(t['year'],t['mon'],t['day'],t['hour'],t['min'],t['sec'],t['cs']*10000)
-  return ComplexNamespace(**d)
+  return exif
 
 if __name__=='__main__':
   for filename in sys.argv[1:]:
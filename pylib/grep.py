@@ -1,6 +1,20 @@
 #!/usr/bin/env python3
 
-import re,sys
+import itertools,os,re,sys
+from collections import deque
+
+try:
+  from re import _parser as sre_parse
+except ImportError:
+  import sre_parse # Python < 3.11
+
+_LITERAL=sre_parse.LITERAL
+_SUBPATTERN=sre_parse.SUBPATTERN
+_ATOMIC_GROUP=getattr(sre_parse,'ATOMIC_GROUP',None)
+_REPEATS=tuple(getattr(sre_parse,op) for op in
+  ('MAX_REPEAT','MIN_REPEAT','POSSESSIVE_REPEAT')
+  if hasattr(sre_parse,op)
+)
 
 class Match(object):
   """This is a fairly thin wrapper around the normal _sre.SRE_Match
@@ -90,6 +104,108 @@ class Match(object):
     return (-1,-1)
 
 
+def required_literals(parsed):
+  """Return a list of literal strings that must appear in any string the
+  given parsed RE (as returned by sre_parse.parse()) matches. The list
+  may be empty, but anything in it really is required.
+
+  >>> required_literals(sre_parse.parse(r'foo\d+(bar|baz)(?:qux){2}x*yz'))
+  ['foo', 'ba', 'qux', 'yz']
+  >>> required_literals(sre_parse.parse(r'(abc)?def|ghi'))
+  []
+  """
+
+  lits=[]
+  run=[]
+  for op,av in parsed:
+    if op is _LITERAL:
+      run.append(chr(av))
+      continue
+    # Anything else ends any literal run we've been building.
+    if run:
+      lits.append(''.join(run))
+      run=[]
+    if op is _SUBPATTERN:
+      group,add_flags,del_flags,p=av
+      if not (add_flags|del_flags)&(re.I|re.A|re.L):
+        lits.extend(required_literals(p))
+    elif op is _ATOMIC_GROUP:
+      lits.extend(required_literals(av))
+    elif op in _REPEATS:
+      lo,hi,p=av
+      if lo>0:
+        lits.extend(required_literals(p))
+  if run:
+    lits.append(''.join(run))
+  return lits
+
+class Prefilter(object):
+  """A Prefilter screens strings for the literal text each of a list of
+  compiled REs requires, so only the REs that might actually match a
+  given string need to be run against it. All the literals sharing the
+  same case-related flags are combined into a single alternation RE, so
+  a string with none of them in it costs just one scan no matter how
+  many REs there are.
+
+  >>> pats=[re.compile(p) for p in (r'error: \d+',r'(?i)WARN',r'\w+')]
+  >>> pf=Prefilter(pats)
+  >>> pf.candidates('all is well')
+  [2]
+  >>> pf.candidates('warning: error: 42')
+  [0, 1, 2]
+  """
+
+  def __init__(self,pats):
+    # Patterns with no usable literal are always candidates.
+    self.always=[]
+    # Map case-related flags to a list of (i,literal) tuples.
+    groups={}
+    for i,p in enumerate(pats):
+      lit=None
+      if isinstance(p.pattern,str):
+        try:
+          lits=required_literals(sre_parse.parse(p.pattern,p.flags))
+        except Exception:
+          lits=[]
+        if lits:
+          lit=max(lits,key=len)
+      if lit:
+        groups.setdefault(p.flags&(re.I|re.A),[]).append((i,lit))
+      else:
+        self.always.append(i)
+
+    # Each screen is a (search,[(i,test),...]) tuple, where search()
+    # finds any of the group's literals, and each test(val) returns true
+    # if the literal of the ith pattern is in val.
+    self.screens=[]
+    for flags,items in groups.items():
+      alts=sorted(set(lit for i,lit in items),key=len,reverse=True)
+      search=re.compile('|'.join(map(re.escape,alts)),flags).search
+      tests=[]
+      for i,lit in items:
+        if flags&re.I:
+          tests.append((i,re.compile(re.escape(lit),flags).search))
+        else:
+          tests.append((i,lit))
+      self.screens.append((search,tests))
+
+  def candidates(self,val):
+    """Return a sorted list of the indices of the patterns that might
+    match the given string."""
+
+    found=list(self.always)
+    for search,tests in self.screens:
+      if search(val):
+        if len(tests)==1:
+          found.append(tests[0][0])
+          continue
+        for i,test in tests:
+          if (test in val) if isinstance(test,str) else test(val):
+            found.append(i)
+    if len(self.screens)>1 or self.always:
+      found.sort()
+    return found
+
 class Grep(object):
 
   _dummy_pattern=re.compile('dummy')
@@ -124,6 +240,14 @@ class Grep(object):
                  argument, in which case you can think of this as a
                  doesnt_match_all flag.)
 
+      engine:    String defaults to "plain", which runs every RE
+                 against every input item. The "prefilter" engine first
+                 screens each item for the literal text each RE
+                 requires (see the Prefilter class) and runs only the
+                 REs that might match. The results are identical, but
+                 "prefilter" can be much faster with many REs and input
+                 that mostly doesn't match.
+
       value:     Function defaults to None. This function accecpts the
                  value of one item in the list of items to be searched
                  and returns the string value to use in the search on
@@ -133,7 +257,7 @@ class Grep(object):
                  items (e.g. a list of mixed-type values or of database
                  rows).
 
-    All but the flags keyword argument provide default values for the
+    All but the flags and engine keyword arguments provide default values for the
     same arguments to Grep.__call__().
     '''
 
@@ -143,8 +267,12 @@ class Grep(object):
     self.invert=kwargs.pop('invert',False)
     self.match_all=kwargs.pop('match_all',False)
     self.value=kwargs.pop('value',None)
+    self.engine=kwargs.pop('engine','plain')
     for kw in kwargs:
       raise TypeError('Grep.__init__() got an unexpected keyword argument %r'%(kw,))
+    if self.engine not in ('plain','prefilter'):
+      raise ValueError('Grep engine must be "plain" or "prefilter", not %r'%(self.engine,))
+    self._prefilter=None
 
     # Get our RE pattern(s).
     self.pats=[]
@@ -156,6 +284,7 @@ class Grep(object):
       self.invert=arg.invert
       self.match_all=arg.match_all
       self.value=arg.value
+      self.engine=arg.engine
     elif isinstance(arg,str):
       # Assume this string value is an RE to be compiled.
       self.pats=[re.compile(arg,self.flags)]
@@ -183,7 +312,7 @@ class Grep(object):
     return 'Grep([%s],%s)'%(
       ','.join([repr(p.pattern) for p in self.pats]),
       ','.join(['%s=%r'%(var,getattr(self,var))
-        for var in ('flags','find_all','invert','match_all','value')
+        for var in ('flags','find_all','invert','match_all','value','engine')
       ])
     )
 
@@ -272,21 +401,34 @@ class Grep(object):
     #print('DEBUG: find_all=%r, match_all=%r, invert=%r'%(find_all,match_all,invert))
     #print('DEBUG: value=%r'%value)
     #for p in self.pats: print('DEBUG: RE: %r'%p.pattern)
+    pats=self.pats
+    lr=len(pats)
+    prefilter=None
+    if self.engine=='prefilter':
+      if self._prefilter is None:
+        self._prefilter=Prefilter(pats)
+      prefilter=self._prefilter
+    # If we only want items matching ALL patterns, any item that can't
+    # match all of them can be skipped without running any of them.
+    skip_partial=match_all and not (invert or find_all)
     n=0
     for item in input:
       n+=1
       #print('DEBUG:---------------------\nDEBUG: n=%r'%n)
 
-      #if value:
-      #  val=value(item)
-      #else:
-      #  val=item
       val=value(item) if value else item
-      results=[Match(p.search(val)) for p in self.pats]
-      #print('DEBUG: results=%r'%results)
-      lr=len(results)
-
-      matches=[m for m in results if m.match]
+      if prefilter:
+        candidates=prefilter.candidates(val)
+        if skip_partial and len(candidates)<lr:
+          continue
+        candidates=[pats[i] for i in candidates]
+      else:
+        candidates=pats
+      matches=[]
+      for p in candidates:
+        m=p.search(val)
+        if m:
+          matches.append(Match(m))
       #print('DEBUG: matches=%r'%matches)
       lm=len(matches)
 
@@ -297,17 +439,158 @@ class Grep(object):
       # We've find one of what we're looking for!
       yield (item,n,matches)
 
+  def search_files(self,paths,workers=1,chunksize=16,limit=None,**kwargs):
+    """This is an iterator that searches the lines of each of the given
+    files and returns (filename,line,n,[Match,...]) tuples, where line,
+    n, and [Match,...] are just what __call__() would return for that
+    file. The paths argument is a filename or iterable of filenames, and
+    any directory in it is searched recursively (see walk_files()).
+    Files are opened lazily as the search proceeds, so the full list of
+    files is never held in memory.
+
+    If workers is greater than 1, files are searched in that many
+    worker processes, chunksize files at a time. Only a few chunks are
+    ever in flight, and results are always returned in the same order
+    as the files, exactly as if workers were 1.
+
+    If limit is given, no more than that many results are returned for
+    each file, and each file is read only until that limit is reached.
+
+    Any other keyword arguments (find_all, invert, and match_all) are
+    passed along to __call__(). The value keyword argument isn't
+    supported here, since every item is a line of text.
+
+    Search the lines of two files (in the same process), or all the
+    files under /var/log with 8 worker processes:
+
+      grep=Grep(array_of_REs)
+      for fn,line,n,matches in grep.search_files(['a.log','b.log']):
+        sys.stdout.write(f"{fn}: {line}")
+
+      for fn,line,n,matches in grep.search_files('/var/log',workers=8):
+        sys.stdout.write(f"{fn}: {line}")
+    """
+
+    if 'value' in kwargs:
+      raise TypeError('Grep.search_files() got an unexpected keyword argument %r'%('value',))
+    files=walk_files(paths)
+    if workers<=1:
+      for filename in files:
+        for line,n,matches in self._search_file(filename,limit,kwargs):
+          yield (filename,line,n,matches)
+      return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Each worker process gets its own copy of this Grep object, minus any
+    # value function (which might not be picklable anyway).
+    worker=Grep(self)
+    worker.value=None
+    chunks=_chunks(files,chunksize)
+    pool=ProcessPoolExecutor(workers,initializer=_init_worker,initargs=(worker,))
+    try:
+      pending=deque(
+        pool.submit(_search_chunk,chunk,limit,kwargs)
+          for chunk in itertools.islice(chunks,workers*2)
+      )
+      while pending:
+        results=pending.popleft().result()
+        for chunk in itertools.islice(chunks,1):
+          pending.append(pool.submit(_search_chunk,chunk,limit,kwargs))
+        for filename,hits in results:
+          for line,n,indices in hits:
+            # Match objects can't cross process boundaries, so we run the
+            # patterns that matched this line again to get them.
+            yield (filename,line,n,[Match(self.pats[i].search(line)) for i in indices])
+    finally:
+      pool.shutdown(wait=True,cancel_futures=True)
+
+  def _search_file(self,filename,limit,kwargs):
+    """Generate (line,n,[Match,...]) results for the given file, which
+    is read only as these are consumed."""
+
+    with open(filename) as f:
+      results=self(f,**kwargs)
+      if limit is not None:
+        results=itertools.islice(results,limit)
+      yield from results
+
+def walk_files(paths):
+  """Generate the name of each file in the given path or iterable of
+  paths. Directories are walked recursively, with the files in each
+  directory and its subdirectories in alphabetical order. Anything
+  that isn't a directory is returned as it is.
+
+  >>> import tempfile
+  >>> with tempfile.TemporaryDirectory() as tmp:
+  ...   for fn in ('b','a',os.path.join('c','d')):
+  ...     os.makedirs(os.path.dirname(os.path.join(tmp,fn)),exist_ok=True)
+  ...     open(os.path.join(tmp,fn),'w').close()
+  ...   [os.path.relpath(fn,tmp) for fn in walk_files([tmp])]
+  ['a', 'b', 'c/d']
+  """
+
+  if isinstance(paths,str):
+    paths=[paths]
+  for path in paths:
+    if os.path.isdir(path):
+      for dirpath,dirs,files in os.walk(path):
+        dirs.sort()
+        for f in sorted(files):
+          yield os.path.join(dirpath,f)
+    else:
+      yield path
+
+def _chunks(iterable,size):
+  "Generate lists of up to size items from the given iterable."
+
+  it=iter(iterable)
+  while True:
+    chunk=list(itertools.islice(it,max(1,size)))
+    if not chunk:
+      break
+    yield chunk
+
+# This is the Grep object a worker process of Grep.search_files() uses.
+_worker_grep=None
+
+def _init_worker(grep):
+  "Set up the Grep object for this worker process."
+
+  global _worker_grep
+  _worker_grep=grep
+
+def _search_chunk(filenames,limit,kwargs):
+  """Search the given files in this worker process, and return a list
+  of (filename,[(line,n,[i,...]),...]) tuples, where each i is the
+  index of a pattern that matched the line."""
+
+  grep=_worker_grep
+  index={}
+  for i,p in enumerate(grep.pats):
+    index.setdefault(p,i)
+  results=[]
+  for filename in filenames:
+    hits=[
+      (line,n,[index[m.match.re] for m in matches])
+        for line,n,matches in grep._search_file(filename,limit,kwargs)
+    ]
+    results.append((filename,hits))
+  return results
+
 if __name__=='__main__':
   import argparse,os
 
   ap=argparse.ArgumentParser(
     usage="%(prog)s [OPTIONS] [FILE] RE ...",
-    description="""This is the test mode of my grep Python module, but you can also use it as a kind of screwey (see the very backward-looking usage above) replacement for your native grep command. Note that this command can be given only one input file, but many regular expressions. By default a line of input is regarded as a match if it matches at least one RE.""",
+    description="""This is the test mode of my grep Python module, but you can also use it as a kind of screwey (see the very backward-looking usage above) replacement for your native grep command. Note that this command can be given only one input file, but many regular expressions, unless you use -f to name as many files (or directories) as you like. By default a line of input is regarded as a match if it matches at least one RE.""",
     epilog="""The exit status is 0 if the match was successfull. Otherwise, a value of 1 is returned. If an error occurrs, a value >= 2 is returned. 
 
 If -l is used with --find-files, no filenames are output. The caller must test the exit code to know whether a match was found (or not found, if -v was also given)."""
   )
+  ap.add_argument('-f',dest='files',metavar='PATH',action='append',default=[],help="Search this file, or all files under this directory. Use -f as many times as you need to. Output lines are preceded by filenames if more than one file might be searched.")
   ap.add_argument('-i',dest='ignore_case',action='store_true',default=False,help="Ingore case.")
+  ap.add_argument('-j',dest='workers',metavar='N',action='store',type=int,default=1,help="Search files with N worker processes. Output is in the same order either way. (default: %(default)s)")
   ap.add_argument('-l',dest='list_only',action='store_true',default=False,help="Only list the names of files where matches are found. Don't show the actual matches. In this mode, the input file is searched only until the first match.")
   ap.add_argument('--find-all',dest='find_all',action='store_true',default=False,help="Output all lines, including those that do not match any pattern.")
   ap.add_argument('--match-all',dest='match_all',action='store_true',default=False,help="Matching lines must match all paterns rather than at least one pattern.")
@@ -315,12 +598,13 @@ If -l is used with --find-files, no filenames are output. The caller must test t
   ap.add_argument('-n',dest='line_numbers',action='store_true',default=False,help="Each output line is preceded by its line number, starting at 1.")
   ap.add_argument('--find-files',dest='find_files',action='store',default=None,help="Rather than searching standard input, find filenames matching the given regular expressions.")
   ap.add_argument('-v',dest='invert',action='store_true',default=False,help="Output non-matching lines rather than matching ones.")
+  ap.add_argument('--engine',dest='engine',action='store',choices=('plain','prefilter'),default='prefilter',help="Use the plain engine to run every RE against every line, or the prefilter engine to run only those REs whose literal text is found in the line. (default: %(default)s)")
   ap.add_argument('res',metavar='RE',action='store',nargs='+',help="One or more regular expressions to match against input lines (or filenames if --find-files is given.")
   opt=ap.parse_args()
 
   def die(msg,rc=1):
     if msg:
-      sys.stderr.write('%s: %s\n'%(ap.get_prog_name(),msg))
+      sys.stderr.write('%s: %s\n'%(ap.prog,msg))
     sys.exit(rc)
 
   if opt.invert and opt.matches_only:
@@ -334,48 +618,66 @@ If -l is used with --find-files, no filenames are output. The caller must test t
     match_all=opt.match_all,
     invert=opt.invert,
     flags=flags,
+    engine=opt.engine,
   )
 
   if opt.find_files:
     # This mode works a little like the standard find command.
 
     def find_files(root):
-      """Return (path,filename) tuple or each file under the
+      """Generate a (path,filename) tuple for each file under the
       given root."""
 
-      file_list=[]
       for path,dirs,files in os.walk(root):
+        dirs.sort()
         for f in sorted(files):
-          file_list.append((path,f))
-      return file_list
+          yield (path,f)
 
     grep=Grep(opt.res,value=lambda x:x[1],**grep_options)
-    all_files=find_files(opt.find_files)
-    good_files=[dirfile for dirfile,n,matches in grep(all_files)]
-    print('\n'.join([os.path.join(*dirfile) for dirfile in good_files]))
+    return_code=1
+    for dirfile,n,matches in grep(find_files(opt.find_files)):
+      return_code=0
+      if opt.list_only:
+        break
+      print(os.path.join(*dirfile))
 
   else:
 
     # This mode works kind of like the standard grep command.
 
     # Figure out what the user put on the command line.
-    if len(opt.res)>0 and not sys.stdin.isatty():
+    if opt.files:
+      show_filename=len(opt.files)>1 or any(os.path.isdir(fn) for fn in opt.files)
+    elif len(opt.res)>0 and not sys.stdin.isatty():
       filename='stdin'
       infile=sys.stdin
     elif len(opt.res)>1:
-      filename=opt.res.pop(0)
-      infile=open(filename)
+      opt.files=[opt.res.pop(0)]
+      show_filename=False
     else:
       ap.print_usage()
       sys.exit(2)
 
+    grep=Grep(opt.res,**grep_options)
+    if opt.files:
+      results=grep.search_files(
+        opt.files,
+        workers=opt.workers,
+        limit=1 if opt.list_only else None
+      )
+    else:
+      results=((filename,line,n,matches) for line,n,matches in grep(infile))
+
     return_code=1
-    for line,n,matches in Grep(opt.res,**grep_options)(infile):
+    for filename,line,n,matches in results:
       return_code=0
       if opt.list_only:
         print(filename)
-        break
+        if not opt.files:
+          break
+        continue
       prefix=''
+      if opt.files and show_filename: prefix+='%s: '%filename
       if opt.find_all: prefix+=('> ' if matches else '  ')
       if opt.line_numbers: prefix+='%d: '%n
       if opt.matches_only:
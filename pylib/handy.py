@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import fcntl,fnmatch,os,re,shlex,struct,sys,termios,warnings
+import fcntl,fnmatch,os,re,shlex,struct,sys,termios,time,warnings
 
 class AsciiString(str):
   """This is just like str, but any non-ASCII characters are converted
@@ -349,6 +349,148 @@ def compile_filename_patterns(pattern_list):
       pats[i]=re.compile(pats[i])
   return pats
 
+class ScanStats(object):
+  """Per-directory latency statistics gathered by a DirScanner. Each
+  directory listed (and its subdirectories stat()ed) adds one
+  observation.
+
+  >>> st=ScanStats()
+  >>> st.add('/a',0.5); st.add('/b',1.5)
+  >>> st.count,st.total,st.mean,st.minimum,st.maximum,st.slowest
+  (2, 2.0, 1.0, 0.5, 1.5, '/b')
+  """
+
+  def __init__(self):
+    self.count=0
+    self.total=0.0
+    self.minimum=None
+    self.maximum=None
+    self.slowest=None
+
+  def add(self,path,seconds):
+    "Record the number of seconds it took to scan the given path."
+
+    self.count+=1
+    self.total+=seconds
+    if self.minimum is None or seconds<self.minimum:
+      self.minimum=seconds
+    if self.maximum is None or seconds>self.maximum:
+      self.maximum=seconds
+      self.slowest=path
+
+  @property
+  def mean(self):
+    return self.total/self.count if self.count else None
+
+  def __str__(self):
+    if not self.count:
+      return 'no directories scanned'
+    return '%d directories, %.6fs total, %.6fs mean, %.6fs min, %.6fs max (%s)'%(
+      self.count,self.total,self.mean,self.minimum,self.maximum,self.slowest
+    )
+
+def _scan_dir(path):
+  """Return an (entries,seconds) tuple, where entries is a list of
+  os.DirEntry objects for the given directory, sorted by name, and
+  seconds is how long that took. Every subdirectory entry is stat()ed
+  along the way, and since DirEntry objects cache that, nobody else
+  has to."""
+
+  t0=time.perf_counter()
+  with os.scandir(path) as it:
+    entries=sorted(it,key=lambda e:e.name)
+  for e in entries:
+    try:
+      if e.is_dir():
+        e.stat()
+    except OSError:
+      pass
+  return entries,time.perf_counter()-t0
+
+class DirScanner(object):
+  """A DirScanner lists directories for a directory tree traversal,
+  optionally using a pool of worker threads to list the directories
+  the traversal will need next while it's busy with the current one.
+  On network file systems, where every directory listing is a round
+  trip, this hides most of that latency.
+
+  The traversal itself stays serial, so its ordering is unchanged. It
+  just calls prefetch() with the paths it expects to need, in the order
+  it expects to need them, scan() when it actually needs one, and
+  discard() for any it turns out not to need after all. No
+  more than lookahead directories (default: 4 per worker) are ever
+  queued or in progress at once. With workers=0, everything is listed
+  synchronously by scan().
+
+  Per-directory latency is recorded in the stats attribute, which is a
+  ScanStats instance.
+
+  >>> with DirScanner(workers=2) as scanner:
+  ...   scanner.prefetch(['.'])
+  ...   names=[e.name for e in scanner.scan('.')]
+  >>> names==sorted(os.listdir('.'))
+  True
+  >>> scanner.stats.count
+  1
+  """
+
+  def __init__(self,workers=0,lookahead=None,stats=None):
+    self.workers=workers
+    self.lookahead=workers*4 if lookahead is None else lookahead
+    self.stats=ScanStats() if stats is None else stats
+    self.pending={} # Map paths to futures for their listings.
+    self.pool=None
+    if workers>0:
+      from concurrent.futures import ThreadPoolExecutor
+      self.pool=ThreadPoolExecutor(workers)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self,*args):
+    self.close()
+
+  def prefetch(self,paths):
+    """Queue up the given paths, which should be in the order they'll
+    be scanned, to be listed in the background. Paths beyond our
+    lookahead limit are quietly left for later."""
+
+    if self.pool:
+      for path in paths:
+        if len(self.pending)>=self.lookahead:
+          break
+        if path not in self.pending:
+          self.pending[path]=self.pool.submit(_scan_dir,path)
+
+  def scan(self,path):
+    """Return a list of os.DirEntry objects for the given directory,
+    sorted by name. Any OSError from listing the directory is raised
+    here, just as os.scandir() would raise it."""
+
+    future=self.pending.pop(path,None)
+    if future:
+      entries,seconds=future.result()
+    else:
+      entries,seconds=_scan_dir(path)
+    self.stats.add(path,seconds)
+    return entries
+
+  def discard(self,path):
+    """Forget about a path given to prefetch() that won't be scanned
+    after all, so it doesn't keep using up our lookahead."""
+
+    future=self.pending.pop(path,None)
+    if future:
+      future.cancel()
+
+  def close(self):
+    "Abandon any outstanding listings, and shut down our worker threads."
+
+    if self.pool:
+      self.pool.shutdown(wait=True,cancel_futures=True)
+      self.pool=None
+    self.pending.clear()
+
 def file_walker(root,**kwargs):
   """This is a recursive iterator over the files in a given directory
   (the root), in all subdirectories beneath it, and so forth. The order
@@ -356,7 +498,9 @@ def file_walker(root,**kwargs):
   tree.
   
   If anyone cares: While the effect of this function is to recurse into
-  subdirectories, the function itself is not recursive.
+  subdirectories, the function itself is not recursive. It's built on
+  os.scandir(), so file types come from the directory listing itself,
+  and only subdirectories are ever stat()ed.
 
   Keyword Arguments:
     depth        (default: None) The number of directories this
@@ -366,8 +510,9 @@ def file_walker(root,**kwargs):
                  directories' files, and so forth.
     follow_links (default: True) True if symlinks are to be followed.
                  This iterator guards against processing the same
-                 directory twice, even if there's a symlink loop, so
-                 it's always safe to leave this set to True.
+                 directory twice (by device and inode), even if there's
+                 a symlink loop, so it's always safe to leave this set
+                 to True.
     prune        (default: []) A list of filespecs, regular
                  expressions (prefixed by 're:'), or pre-compiled RE
                  objects. If any of these matches the name of an
@@ -385,7 +530,34 @@ def file_walker(root,**kwargs):
                  not descended into because of depth-limiting or
                  pruning, that directory will not appear in this
                  iterator's values at all. The default is False, meaning
-                 only non-directory entries are included."""
+                 only non-directory entries are included.
+    entries      (default: False) If True, this iterator's values are
+                 (path,entry) tuples, where entry is the os.DirEntry
+                 object for that path (or None for the root directory).
+                 DirEntry objects cache their file type and stat()
+                 results, so callers can use them rather than hitting
+                 the file system again.
+    workers      (default: 0) The number of threads to list directories
+                 with ahead of the traversal. (See DirScanner.) The
+                 order of this iterator's values is the same regardless.
+    stats        (default: None) A ScanStats object to record the time
+                 taken to list each directory in.
+
+  >>> import tempfile
+  >>> with tempfile.TemporaryDirectory() as tmp:
+  ...   for fn in ('b/x','b/c/y','a','c'):
+  ...     os.makedirs(os.path.dirname(os.path.join(tmp,fn)),exist_ok=True)
+  ...     open(os.path.join(tmp,fn),'w').close()
+  ...   os.symlink(os.path.join(tmp,'b'),os.path.join(tmp,'b','c','loop'))
+  ...   [os.path.relpath(fn,tmp) for fn in file_walker(tmp)]
+  ...   [os.path.relpath(fn,tmp) for fn in file_walker(tmp,depth=0)]
+  ...   [(os.path.relpath(fn,tmp),e.is_file()) for fn,e in file_walker(tmp,ignore=['a'],entries=True)]
+  ...   [os.path.relpath(fn,tmp) for fn in file_walker(tmp,workers=4,report_dirs='first')]
+  ['a', 'c', 'b/x', 'b/c/y']
+  ['a', 'c']
+  [('c', True), ('b/x', True), ('b/c/y', True)]
+  ['.', 'a', 'c', 'b', 'b/x', 'b/c', 'b/c/y']
+  """
 
   # Get our keyword argunents, and do some initialization.
   max_depth=kwargs.get('depth',None)
@@ -397,50 +569,69 @@ def file_walker(root,**kwargs):
   report_dirs=kwargs.get('report_dirs',False)
   if report_dirs not in (False,True,'first','last'):
     raise ValueError("report_dirs=%r is not one of False, True, 'first', or 'last'."%(report_dirs,))
-  stack=[(0,root)] # Prime our stack with root (at depth 0).
-  been_there=set([os.path.abspath(os.path.realpath(root))])
+  entries=kwargs.get('entries',False)
+  scanner=DirScanner(kwargs.get('workers',0),stats=kwargs.get('stats',None))
+  stack=[(0,root,None)] # Prime our stack with root (at depth 0).
+  st=os.stat(root)
+  been_there=set([(st.st_dev,st.st_ino)])
   dir_stack=[] # Stack of paths we're yielding after exhausting those directories.
 
+  try:
+    yield from _file_walker(scanner,stack,been_there,dir_stack,max_depth,follow_links,prune,ignore,report_dirs,entries)
+  finally:
+    scanner.close()
+
+def _file_walker(scanner,stack,been_there,dir_stack,max_depth,follow_links,prune,ignore,report_dirs,entries):
+  "This is the engine of file_walker(). Keep your mitts off this one."
+
   while stack:
-    depth,path=stack.pop()
+    depth,path,entry=stack.pop()
     if report_dirs in (True,'first'):
-      yield path+os.sep
+      yield (path+os.sep,entry) if entries else path+os.sep
     elif report_dirs=='last':
-      dir_stack.append(path+os.sep)
-    flist=os.listdir(path)
-    flist.sort()
+      dir_stack.append((path+os.sep,entry) if entries else path+os.sep)
+    # Get the next few directories we'll need started in the background.
+    scanner.prefetch(s[1] for s in reversed(stack))
+    flist=scanner.scan(path)
     dlist=[]
     # First, let the caller iterate over these filenames.
-    for fn in flist:
-      p=os.path.join(path,fn)
-      if os.path.isdir(p):
+    for e in flist:
+      try:
+        is_dir=e.is_dir()
+      except OSError:
+        is_dir=False
+      if is_dir:
         # Just add this to this path's list of directories for now.
-        dlist.insert(0,fn)
+        dlist.append(e)
         continue
-      pat,mat=first_match(fn,ignore)
+      pat,mat=first_match(e.name,ignore)
       if not pat:
-        yield p
+        yield (e.path,e) if entries else e.path
     # Don't dig deeper than we've been told to.
     if depth<max_depth:
-      # Now, let's deal with the directories we found.
-      for fn in dlist:
-        p=os.path.join(path,fn)
+      # Now, let's deal with the directories we found, pushing them in
+      # reverse order so they're popped in alphabetical order.
+      for e in reversed(dlist):
         # We might need to stack this path for our fake recursion.
-        if os.path.islink(p) and not follow_links:
+        if not follow_links and e.is_symlink():
           # Nope. We're not following symlinks.
           continue
-        rp=os.path.abspath(os.path.realpath(p))
-        if rp in been_there:
+        try:
+          st=e.stat()
+        except OSError:
+          continue
+        key=(st.st_dev,st.st_ino)
+        if key in been_there:
           # Nope. We've already seen this path (and possibly processed it).
           continue
-        m=None
-        pat,mat=first_match(fn,prune)
+        pat,mat=first_match(e.name,prune)
         if pat:
           # Nope. This directory matches one of the prune patterns.
           continue
         # We have a keeper! Record the path and push it onto the stack.
-        been_there.add(rp)
-        stack.append((depth+1,p))
+        been_there.add(key)
+        stack.append((depth+1,e.path,e))
+      scanner.prefetch(s[1] for s in reversed(stack))
   while dir_stack:
     yield dir_stack.pop()
 
@@ -784,6 +975,8 @@ if __name__=='__main__':
   sp_find.add_argument('--depth',action='store',type=non_negative_int,default=sys.maxsize,help="The number of directories to decend below the given path when traversing the directory structure.")
   sp_find.add_argument('--follow',action='store_true',help="Follow symlinks to directories during recursion. The method used is safe from symlink loops.")
   sp_find.add_argument('--ignore',metavar='FILE',action='store',nargs='+',default=[],help="A list of filespecs and/or regular expressions (prefixed with 're:') identifying files NOT to be reported.")
+  sp_find.add_argument('--stats',action='store_true',help="Report per-directory latency statistics to standard error when finished.")
+  sp_find.add_argument('--workers',metavar='N',action='store',type=non_negative_int,default=0,help="List directories with N threads ahead of the traversal. Output is in the same order either way. (default: %(default)s)")
   sp_find.add_argument('--prune',metavar='DIR',action='store',nargs='+',default=[],help="A list of filespecs and/or regular expressions (prefixed with 're:') identifying directories NOT to be recursed into.")
   sp_find.add_argument('--dirs',dest='dirs',action='store',default='False',choices=('true','false','first','last'),help="If 'true' or 'first', output the path (with a %s suffix) immediately before listing the files in that directory. If 'last', output the path immediately after all files and other directories under that path have been output. Directory names are suppressed by default."%os.sep)
 
@@ -811,5 +1004,8 @@ if __name__=='__main__':
     # Expand ~ or environment variables in our path.
     opt.path=os.path.expandvars(os.path.expanduser(opt.path))
     # Put file_walker through its paces.
-    for fn in file_walker(opt.path,depth=opt.depth,follow_links=opt.follow,prune=opt.prune,ignore=opt.ignore,report_dirs=opt.dirs):
+    stats=ScanStats()
+    for fn in file_walker(opt.path,depth=opt.depth,follow_links=opt.follow,prune=opt.prune,ignore=opt.ignore,report_dirs=opt.dirs,workers=opt.workers,stats=stats):
       print(fn)
+    if opt.stats:
+      sys.stderr.write(f"{stats}\n")